@@ -27,7 +27,8 @@ setup(
         "cookies-samesite-compat",
     ],
     extras_require={
-        "ldap": ["ldap3"]
+        "ldap": ["ldap3"],
+        "orjson": ["orjson"],
     },
     zip_safe=False,
     classifiers=[
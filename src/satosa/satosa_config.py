@@ -1,26 +1,67 @@
 """
 This module contains methods to load, verify and build configurations for the satosa proxy.
 """
+import copy
+import json
 import logging
 import os
 import os.path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from satosa.exception import SATOSAConfigurationError
-from satosa.yaml import load as yaml_load
+from satosa.yaml import load_with_environment_info
 from satosa.yaml import YAMLError
 
 
 logger = logging.getLogger(__name__)
 
+# parsed config files, keyed by absolute path; values are (size, mtime in ns, config)
+# and an entry is replaced once the file's size or mtime changes
+_PARSE_CACHE = {}
+
+
+def json_loads(content):
+    """
+    Parse JSON with orjson when it is installed. Content orjson rejects, such as UTF-8
+    with a byte order mark or UTF-16/32, is handed to the json module so that the same
+    configs are accepted with or without orjson.
+
+    :type content: bytes
+    :rtype: object
+
+    :param content: raw JSON document
+    :return: the parsed JSON document
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(content)
+
 
 class SATOSAConfig(object):
     """
     A configuration class for the satosa proxy. Verifies that the given config holds all the
     necessary parameters.
+
+    Configuration files with a ".json" extension are parsed as JSON, which is considerably
+    faster than YAML; use it for configs that do not need comments, anchors or the
+    !ENV/!ENVFILE tags. All other files are parsed as YAML.
+
+    Parsed files are cached and only read again when their size or modification time
+    changes. On filesystems with a coarse modification time an edit that keeps the size
+    of a file may go unnoticed; call clear_cache() to force the files to be read again.
     """
+    __slots__ = ("_config",)
+
     sensitive_dict_keys = ["STATE_ENCRYPTION_KEY"]
-    mandatory_dict_keys = ["BASE", "BACKEND_MODULES", "FRONTEND_MODULES",
-                           "INTERNAL_ATTRIBUTES", "COOKIE_STATE_NAME"]
+    mandatory_dict_keys = frozenset(["BASE", "BACKEND_MODULES", "FRONTEND_MODULES",
+                                     "INTERNAL_ATTRIBUTES", "COOKIE_STATE_NAME"])
 
     def __init__(self, config):
         """
@@ -32,11 +73,7 @@ class SATOSAConfig(object):
         :param config: Can be a file path or a dictionary
         :return: A verified SATOSAConfig
         """
-        parsers = [self._load_dict, self._load_yaml]
-        for parser in parsers:
-            self._config = parser(config)
-            if self._config is not None:
-                break
+        self._config = self._load(config)
 
         # Load sensitive config from environment variables
         for key in SATOSAConfig.sensitive_dict_keys:
@@ -50,20 +87,15 @@ class SATOSAConfig(object):
         for key in ["BACKEND_MODULES", "FRONTEND_MODULES", "MICRO_SERVICES"]:
             plugin_configs = []
             for config in self._config.get(key, []):
-                for parser in parsers:
-                    plugin_config = parser(config)
-                    if plugin_config:
-                        plugin_configs.append(plugin_config)
-                        break
-                else:
+                plugin_config = self._load(config)
+                if not plugin_config:
                     raise SATOSAConfigurationError('Failed to load plugin config \'{}\''.format(config))
+                plugin_configs.append(plugin_config)
             self._config[key] = plugin_configs
 
-        for parser in parsers:
-            _internal_attributes = parser(self._config["INTERNAL_ATTRIBUTES"])
-            if _internal_attributes is not None:
-                self._config["INTERNAL_ATTRIBUTES"] = _internal_attributes
-                break
+        _internal_attributes = self._load(self._config["INTERNAL_ATTRIBUTES"])
+        if _internal_attributes is not None:
+            self._config["INTERNAL_ATTRIBUTES"] = _internal_attributes
         if not self._config["INTERNAL_ATTRIBUTES"]:
             raise SATOSAConfigurationError("Could not load attribute mapping from 'INTERNAL_ATTRIBUTES.")
 
@@ -81,9 +113,12 @@ class SATOSAConfig(object):
         if not conf:
             raise SATOSAConfigurationError("Missing configuration or unknown format")
 
-        for key in SATOSAConfig.mandatory_dict_keys:
-            if key not in conf:
-                raise SATOSAConfigurationError("Missing key '%s' in config" % key)
+        missing_keys = SATOSAConfig.mandatory_dict_keys.difference(conf)
+        if missing_keys:
+            raise SATOSAConfigurationError(
+                "Missing keys in config: %s"
+                % ", ".join("'%s'" % key for key in sorted(missing_keys))
+            )
 
         for key in SATOSAConfig.sensitive_dict_keys:
             if key not in conf and "SATOSA_{key}".format(key=key) not in os.environ:
@@ -117,9 +152,95 @@ class SATOSAConfig(object):
     def __contains__(self, key):
         return key in self._config
 
+    def __iter__(self):
+        return iter(self._config)
+
     def get(self, item, default=None):
         return self._config.get(item, default)
 
+    @staticmethod
+    def clear_cache():
+        """
+        Forget all config files parsed so far, forcing them to be read again.
+
+        Each file has at most one cache entry, replaced when it is parsed again. Cached
+        files are only read again when their size or modification time changes, so
+        use this after editing a config file in place on a filesystem with a coarse
+        modification time resolution.
+        """
+        _PARSE_CACHE.clear()
+
+    def _load(self, config):
+        """
+        Load config with the parser matching its format
+
+        :type config: str | dict
+        :rtype: dict
+
+        :param config: config to load. Can be a file path or a dictionary
+        :return: Loaded config
+        """
+        return self._detect_format(config)(config)
+
+    def _detect_format(self, config):
+        """
+        Pick the parser for the given config: dictionaries are used as is, files with a
+        ".json" extension are parsed as JSON and anything else as YAML.
+
+        :type config: str | dict
+        :rtype: (str | dict) -> dict
+
+        :param config: config to inspect
+        :return: parser for the config
+        """
+        if isinstance(config, dict):
+            return self._load_dict
+        if isinstance(config, str) and config.endswith(".json"):
+            return self._load_json
+        return self._load_yaml
+
+    def _is_file(self, config_file):
+        """
+        Check that the config is a path to an existing file, without raising for other inputs.
+
+        :type config_file: object
+        :rtype: bool
+
+        :param config_file: config to check
+        :return: True if config is a path to a file, else False
+        """
+        return isinstance(config_file, str) and os.path.isfile(config_file)
+
+    def _parse_file(self, config_file, parse):
+        """
+        Read and parse a config file, reusing the result of an earlier parse if the file
+        has not changed since. Files resolving !ENV/!ENVFILE tags are never cached since
+        their result also depends on the environment.
+
+        :type config_file: str
+        :type parse: (bytes) -> (dict, bool)
+        :rtype: dict
+
+        :param config_file: path to the config file
+        :param parse: function parsing the raw (undecoded) file content, returning the
+        config and whether it depends on the environment
+        :return: Loaded config
+        """
+        path = os.path.abspath(config_file)
+        stat = os.stat(path)
+        cached = _PARSE_CACHE.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return copy.deepcopy(cached[2])
+
+        with open(path, "rb") as f:
+            content = f.read()
+        config, uses_environment = parse(content)
+        if uses_environment:
+            _PARSE_CACHE.pop(path, None)
+        else:
+            _PARSE_CACHE[path] = (stat.st_size, stat.st_mtime_ns, copy.deepcopy(config))
+        return config
+
     def _load_dict(self, config):
         """
         Load config from dict
@@ -135,20 +256,45 @@ class SATOSAConfig(object):
 
         return None
 
+    def _load_json(self, config_file):
+        """
+        Load config from json file
+
+        :type config_file: str
+        :rtype: dict
+
+        :param config_file: config to load. Must be a file path with a ".json" extension
+        :return: Loaded config
+        """
+        if not self._is_file(config_file):
+            logger.error("Could not open config file: {}".format(config_file))
+            return None
+
+        try:
+            return self._parse_file(config_file, lambda content: (json_loads(content), False))
+        except ValueError as exc:
+            logger.error("Could not parse config as JSON: {}".format(exc))
+        except IOError as e:
+            logger.error("Could not open config file: {}".format(e))
+
+        return None
+
     def _load_yaml(self, config_file):
         """
-        Load config from yaml file or string
+        Load config from yaml file
 
         :type config_file: str
         :rtype: dict
 
-        :param config_file: config to load. Can be file path or yaml string
+        :param config_file: config to load. Must be a file path
         :return: Loaded config
         """
+        if not self._is_file(config_file):
+            logger.error("Could not open config file: {}".format(config_file))
+            return None
 
         try:
-            with open(os.path.abspath(config_file)) as f:
-                return yaml_load(f.read())
+            return self._parse_file(config_file, load_with_environment_info)
         except YAMLError as exc:
             logger.error("Could not parse config as YAML: {}".format(exc))
             if hasattr(exc, 'problem_mark'):
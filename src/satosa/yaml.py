@@ -1,9 +1,13 @@
 import os
 import re
 
-from yaml import SafeLoader as _safe_loader
 from yaml import YAMLError
-from yaml import safe_load as load
+from yaml import load as _load
+
+try:
+    from yaml import CSafeLoader as _safe_loader
+except ImportError:
+    from yaml import SafeLoader as _safe_loader
 
 
 def _constructor_env_variables(loader, node):
@@ -14,6 +18,7 @@ def _constructor_env_variables(loader, node):
     :return: value of the environment variable
     """
     raw_value = loader.construct_scalar(node)
+    loader.uses_environment = True
     new_value = os.environ.get(raw_value)
     if new_value is None:
         msg = "Cannot construct value from {node}: {value}".format(
@@ -31,6 +36,7 @@ def _constructor_envfile_variables(loader, node):
     :return: value read from file pointed to by environment variable
     """
     raw_value = loader.construct_scalar(node)
+    loader.uses_environment = True
     filepath = os.environ.get(raw_value)
     try:
         with open(filepath, "r") as fd:
@@ -50,3 +56,29 @@ TAG_ENVFILE = "!ENVFILE"
 
 _safe_loader.add_constructor(TAG_ENV, _constructor_env_variables)
 _safe_loader.add_constructor(TAG_ENVFILE, _constructor_envfile_variables)
+
+
+def load(stream):
+    """
+    Parses the given yaml stream using the libyaml backed safe loader when
+    available, falling back to the pure Python implementation.
+    :param stream: yaml string, bytes or file object
+    :return: the parsed python object
+    """
+    return _load(stream, Loader=_safe_loader)
+
+
+def load_with_environment_info(stream):
+    """
+    Parses the given yaml stream like load, also reporting whether the
+    result depends on the environment through the !ENV/!ENVFILE tags.
+    :param stream: yaml string, bytes or file object
+    :return: tuple of the parsed python object and True if any environment
+        tag was resolved, else False
+    """
+    loader = _safe_loader(stream)
+    loader.uses_environment = False
+    try:
+        return loader.get_single_data(), loader.uses_environment
+    finally:
+        loader.dispose()
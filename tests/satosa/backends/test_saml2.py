@@ -7,7 +7,7 @@ from base64 import urlsafe_b64encode
 from collections import Counter
 from datetime import datetime
 from unittest.mock import Mock, patch
-from urllib.parse import urlparse, parse_qs, parse_qsl
+from urllib.parse import urlparse, unquote_plus
 
 import pytest
 
@@ -39,25 +39,31 @@ INTERNAL_ATTRIBUTES = {
 DISCOSRV_URL = "https://my.dicso.com/role/idp.ds"
 
 
+def get_query_params(url):
+    _, _, query = url.partition("?")
+    return {
+        unquote_plus(key): unquote_plus(value)
+        for key, _, value in (param.partition("=") for param in query.split("&") if param)
+    }
+
+
 def assert_redirect_to_discovery_server(
     redirect_response, sp_conf, expected_discosrv_url
 ):
     assert redirect_response.status == "303 See Other"
-    parsed = urlparse(redirect_response.message)
-    redirect_location = "{parsed.scheme}://{parsed.netloc}{parsed.path}".format(parsed=parsed)
+    redirect_location = redirect_response.message.split("?", 1)[0]
     assert redirect_location == expected_discosrv_url
 
-    request_params = dict(parse_qsl(parsed.query))
+    request_params = get_query_params(redirect_response.message)
     assert request_params["return"] == sp_conf["service"]["sp"]["endpoints"]["discovery_response"][0][0]
     assert request_params["entityID"] == sp_conf["entityid"]
 
 
 def assert_redirect_to_idp(redirect_response, idp_conf):
     assert redirect_response.status == "303 See Other"
-    parsed = urlparse(redirect_response.message)
-    redirect_location = "{parsed.scheme}://{parsed.netloc}{parsed.path}".format(parsed=parsed)
+    redirect_location = redirect_response.message.split("?", 1)[0]
     assert redirect_location == idp_conf["service"]["idp"]["endpoints"]["single_sign_on_service"][0][0]
-    assert "SAMLRequest" in parse_qs(parsed.query)
+    assert "SAMLRequest" in get_query_params(redirect_response.message)
 
 
 def assert_authn_response(internal_resp):
@@ -71,25 +77,42 @@ def assert_authn_response(internal_resp):
 def setup_test_config(sp_conf, idp_conf):
     idp_metadata_str = create_metadata_from_config_dict(idp_conf)
     sp_conf["metadata"]["inline"].append(idp_metadata_str)
-    idp2_config = idp_conf.copy()
-    idp2_config["entityid"] = "just_an_extra_idp"
-    idp_metadata_str2 = create_metadata_from_config_dict(idp2_config)
+    # the extra IdP only differs in entity id, so reuse the generated metadata
+    idp_metadata_str2 = idp_metadata_str.replace(
+        'entityID="{}"'.format(idp_conf["entityid"]), 'entityID="just_an_extra_idp"'
+    )
     sp_conf["metadata"]["inline"].append(idp_metadata_str2)
 
     sp_metadata_str = create_metadata_from_config_dict(sp_conf)
     idp_conf["metadata"]["inline"] = [sp_metadata_str]
+    return idp_metadata_str
 
 
 class TestSAMLBackend:
     @pytest.fixture(autouse=True)
-    def create_backend(self, sp_conf, idp_conf):
-        setup_test_config(sp_conf, idp_conf)
-        self.samlbackend = SAMLBackend(Mock(), INTERNAL_ATTRIBUTES, {"sp_config": sp_conf,
-                                                                     "disco_srv": DISCOSRV_URL},
-                                       "base_url",
-                                       "samlbackend")
-
-    def test_register_endpoints(self, sp_conf):
+    def create_metadata(self, sp_conf, idp_conf):
+        self.idp_metadata_str = setup_test_config(sp_conf, idp_conf)
+
+    @pytest.fixture
+    def samlbackend(self, sp_conf):
+        return SAMLBackend(Mock(), INTERNAL_ATTRIBUTES, {"sp_config": sp_conf,
+                                                         "disco_srv": DISCOSRV_URL},
+                           "base_url",
+                           "samlbackend")
+
+    @pytest.fixture
+    def fake_idp(self, idp_conf):
+        return FakeIdP(USERS, config=IdPConfig().load(idp_conf))
+
+    @pytest.fixture
+    def fake_sp(self, sp_conf):
+        return FakeSP(SPConfig().load(sp_conf))
+
+    @pytest.fixture
+    def idp_entityid_b64(self, idp_conf):
+        return urlsafe_b64encode(idp_conf["entityid"].encode("utf-8")).decode("utf-8")
+
+    def test_register_endpoints(self, samlbackend, sp_conf):
         """
         Tests the method register_endpoints
         """
@@ -97,50 +120,49 @@ class TestSAMLBackend:
         def get_path_from_url(url):
             return urlparse(url).path.lstrip("/")
 
-        url_map = self.samlbackend.register_endpoints()
+        url_map = samlbackend.register_endpoints()
         all_sp_endpoints = [get_path_from_url(v[0][0]) for v in sp_conf["service"]["sp"]["endpoints"].values()]
-        compiled_regex = [re.compile(regex) for regex, _ in url_map]
+        combined_regex = re.compile("|".join("(?:{})".format(regex) for regex, _ in url_map))
         for endp in all_sp_endpoints:
-            assert any(p.match(endp) for p in compiled_regex)
+            assert combined_regex.match(endp)
 
-    def test_start_auth_defaults_to_redirecting_to_discovery_server(self, context, sp_conf):
-        resp = self.samlbackend.start_auth(context, InternalData())
+    def test_start_auth_defaults_to_redirecting_to_discovery_server(self, samlbackend, context, sp_conf):
+        resp = samlbackend.start_auth(context, InternalData())
         assert_redirect_to_discovery_server(resp, sp_conf, DISCOSRV_URL)
 
-    def test_discovery_server_set_in_context(self, context, sp_conf):
+    def test_discovery_server_set_in_context(self, samlbackend, context, sp_conf):
         discosrv_url = 'https://my.org/saml_discovery_service'
         context.decorate(
             SAMLBackend.KEY_SAML_DISCOVERY_SERVICE_URL, discosrv_url
         )
-        resp = self.samlbackend.start_auth(context, InternalData())
+        resp = samlbackend.start_auth(context, InternalData())
         assert_redirect_to_discovery_server(resp, sp_conf, discosrv_url)
 
-    def test_full_flow(self, context, idp_conf, sp_conf):
+    def test_full_flow(self, samlbackend, context, idp_conf, sp_conf, fake_idp):
         test_state_key = "test_state_key_456afgrh"
         response_binding = BINDING_HTTP_REDIRECT
-        fakeidp = FakeIdP(USERS, config=IdPConfig().load(idp_conf))
 
         context.state[test_state_key] = "my_state"
 
         # start auth flow (redirecting to discovery server)
-        resp = self.samlbackend.start_auth(context, InternalData())
+        resp = samlbackend.start_auth(context, InternalData())
         assert_redirect_to_discovery_server(resp, sp_conf, DISCOSRV_URL)
 
         # fake response from discovery server
-        disco_resp = parse_qs(urlparse(resp.message).query)
-        info = parse_qs(urlparse(disco_resp["return"][0]).query)
+        disco_resp = get_query_params(resp.message)
+        info = get_query_params(disco_resp["return"])
         info["entityID"] = idp_conf["entityid"]
         request_context = Context()
         request_context.request = info
         request_context.state = context.state
 
         # pass discovery response to backend and check that it redirects to the selected IdP
-        resp = self.samlbackend.disco_response(request_context)
+        resp = samlbackend.disco_response(request_context)
         assert_redirect_to_idp(resp, idp_conf)
 
         # fake auth response to the auth request
-        req_params = dict(parse_qsl(urlparse(resp.message).query))
-        url, fake_idp_resp = fakeidp.handle_auth_req(
+        req_params = get_query_params(resp.message)
+        url, fake_idp_resp = fake_idp.handle_auth_req(
             req_params["SAMLRequest"],
             req_params["RelayState"],
             BINDING_HTTP_REDIRECT,
@@ -151,76 +173,68 @@ class TestSAMLBackend:
         response_context.state = request_context.state
 
         # pass auth response to backend and verify behavior
-        self.samlbackend.authn_response(response_context, response_binding)
-        context, internal_resp = self.samlbackend.auth_callback_func.call_args[0]
-        assert self.samlbackend.name not in context.state
+        samlbackend.authn_response(response_context, response_binding)
+        context, internal_resp = samlbackend.auth_callback_func.call_args[0]
+        assert samlbackend.name not in context.state
         assert context.state[test_state_key] == "my_state"
         assert_authn_response(internal_resp)
 
     def test_start_auth_redirects_directly_to_mirrored_idp(
-            self, context, idp_conf):
+            self, samlbackend, context, idp_conf):
         entityid = idp_conf["entityid"]
         context.decorate(Context.KEY_TARGET_ENTITYID, entityid)
 
-        resp = self.samlbackend.start_auth(context, InternalData())
+        resp = samlbackend.start_auth(context, InternalData())
         assert_redirect_to_idp(resp, idp_conf)
 
     def test_redirect_to_idp_if_only_one_idp_in_metadata(self, context, sp_conf, idp_conf):
-        sp_conf["metadata"]["inline"] = [create_metadata_from_config_dict(idp_conf)]
+        sp_conf["metadata"]["inline"] = [self.idp_metadata_str]
         # instantiate new backend, without any discovery service configured
         samlbackend = SAMLBackend(None, INTERNAL_ATTRIBUTES, {"sp_config": sp_conf}, "base_url", "saml_backend")
 
         resp = samlbackend.start_auth(context, InternalData())
         assert_redirect_to_idp(resp, idp_conf)
 
-    def test_authn_request(self, context, idp_conf):
-        resp = self.samlbackend.authn_request(context, idp_conf["entityid"])
+    def test_authn_request(self, samlbackend, context, idp_conf):
+        resp = samlbackend.authn_request(context, idp_conf["entityid"])
         assert_redirect_to_idp(resp, idp_conf)
-        req_params = dict(parse_qsl(urlparse(resp.message).query))
-        assert context.state[self.samlbackend.name]["relay_state"] == req_params["RelayState"]
+        req_params = get_query_params(resp.message)
+        assert context.state[samlbackend.name]["relay_state"] == req_params["RelayState"]
 
-    def test_authn_response(self, context, idp_conf, sp_conf):
+    def test_authn_response(self, samlbackend, context, idp_conf, fake_idp, fake_sp):
         response_binding = BINDING_HTTP_REDIRECT
-        fakesp = FakeSP(SPConfig().load(sp_conf))
-        fakeidp = FakeIdP(USERS, config=IdPConfig().load(idp_conf))
-        destination, request_params = fakesp.make_auth_req(idp_conf["entityid"])
-        url, auth_resp = fakeidp.handle_auth_req(request_params["SAMLRequest"], request_params["RelayState"],
-                                                 BINDING_HTTP_REDIRECT,
-                                                 "testuser1", response_binding=response_binding)
+        destination, request_params = fake_sp.make_auth_req(idp_conf["entityid"])
+        url, auth_resp = fake_idp.handle_auth_req(request_params["SAMLRequest"], request_params["RelayState"],
+                                                  BINDING_HTTP_REDIRECT,
+                                                  "testuser1", response_binding=response_binding)
 
         context.request = auth_resp
-        context.state[self.samlbackend.name] = {"relay_state": request_params["RelayState"]}
-        self.samlbackend.authn_response(context, response_binding)
+        context.state[samlbackend.name] = {"relay_state": request_params["RelayState"]}
+        samlbackend.authn_response(context, response_binding)
 
-        context, internal_resp = self.samlbackend.auth_callback_func.call_args[0]
+        context, internal_resp = samlbackend.auth_callback_func.call_args[0]
         assert_authn_response(internal_resp)
-        assert self.samlbackend.name not in context.state
+        assert samlbackend.name not in context.state
 
     @pytest.mark.skipif(
             saml2.__version__ < '4.6.1',
             reason="Optional NameID needs pysaml2 v4.6.1 or higher")
-    def test_authn_response_no_name_id(self, context, idp_conf, sp_conf):
+    def test_authn_response_no_name_id(self, samlbackend, context, idp_conf, fake_idp, fake_sp):
         response_binding = BINDING_HTTP_REDIRECT
 
-        fakesp_conf = SPConfig().load(sp_conf)
-        fakesp = FakeSP(fakesp_conf)
-
-        fakeidp_conf = IdPConfig().load(idp_conf)
-        fakeidp = FakeIdP(USERS, config=fakeidp_conf)
-
-        destination, request_params = fakesp.make_auth_req(
+        destination, request_params = fake_sp.make_auth_req(
             idp_conf["entityid"])
 
         # Use the fake IdP to mock up an authentication request that has no
         # <NameID> element.
-        url, auth_resp = fakeidp.handle_auth_req_no_name_id(
+        url, auth_resp = fake_idp.handle_auth_req_no_name_id(
             request_params["SAMLRequest"],
             request_params["RelayState"],
             BINDING_HTTP_REDIRECT,
             "testuser1",
             response_binding=response_binding)
 
-        backend = self.samlbackend
+        backend = samlbackend
 
         context.request = auth_resp
         context.state[backend.name] = {
@@ -258,7 +272,7 @@ class TestSAMLBackend:
 
         context.request = {"SAMLResponse": deflate_and_base64_encode(auth_response), "RelayState": relay_state}
 
-        context.state[self.samlbackend.name] = {"relay_state": relay_state}
+        context.state[samlbackend.name] = {"relay_state": relay_state}
         with open(
             os.path.join(TEST_RESOURCE_BASE_PATH, "encryption_key.pem")
         ) as encryption_key_file:
@@ -292,14 +306,14 @@ class TestSAMLBackend:
                                   "base_url", "samlbackend")
         assert samlbackend.encryption_keys
 
-    def test_metadata_endpoint(self, context, sp_conf):
-        resp = self.samlbackend._metadata_endpoint(context)
+    def test_metadata_endpoint(self, samlbackend, context, sp_conf):
+        resp = samlbackend._metadata_endpoint(context)
         headers = dict(resp.headers)
         assert headers["Content-Type"] == "text/xml"
         assert sp_conf["entityid"] in resp.message
 
-    def test_get_metadata_desc(self, sp_conf, idp_conf):
-        sp_conf["metadata"]["inline"] = [create_metadata_from_config_dict(idp_conf)]
+    def test_get_metadata_desc(self, sp_conf, idp_conf, idp_entityid_b64):
+        sp_conf["metadata"]["inline"] = [self.idp_metadata_str]
         # instantiate new backend, with a single backing IdP
         samlbackend = SAMLBackend(None, INTERNAL_ATTRIBUTES, {"sp_config": sp_conf}, "base_url", "saml_backend")
         entity_descriptions = samlbackend.get_metadata_desc()
@@ -308,7 +322,7 @@ class TestSAMLBackend:
 
         idp_desc = entity_descriptions[0].to_dict()
 
-        assert idp_desc["entityid"] == urlsafe_b64encode(idp_conf["entityid"].encode("utf-8")).decode("utf-8")
+        assert idp_desc["entityid"] == idp_entityid_b64
         assert idp_desc["contact_person"] == idp_conf["contact_person"]
 
         assert idp_desc["organization"]["name"][0] == tuple(idp_conf["organization"]["name"][0])
@@ -321,7 +335,7 @@ class TestSAMLBackend:
         assert ui_info["description"] == expected_ui_info["description"]
         assert ui_info["logo"] == expected_ui_info["logo"]
 
-    def test_get_metadata_desc_with_logo_without_lang(self, sp_conf, idp_conf):
+    def test_get_metadata_desc_with_logo_without_lang(self, sp_conf, idp_conf, idp_entityid_b64):
         # add logo without 'lang'
         idp_conf["service"]["idp"]["ui_info"]["logo"] = [{"text": "https://idp.example.com/static/logo.png",
                                                           "width": "120", "height": "60"}]
@@ -335,7 +349,7 @@ class TestSAMLBackend:
 
         idp_desc = entity_descriptions[0].to_dict()
 
-        assert idp_desc["entityid"] == urlsafe_b64encode(idp_conf["entityid"].encode("utf-8")).decode("utf-8")
+        assert idp_desc["entityid"] == idp_entityid_b64
         assert idp_desc["contact_person"] == idp_conf["contact_person"]
 
         assert idp_desc["organization"]["name"][0] == tuple(idp_conf["organization"]["name"][0])
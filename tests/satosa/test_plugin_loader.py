@@ -75,3 +75,8 @@ class TestLoadPluginConfig(object):
         data = """{foo: bar"""  # missing closing bracket
         with pytest.raises(SATOSAConfigurationError):
             _load_plugin_config(data)
+
+    def test_rejects_python_object_tags(self):
+        data = """!!python/tuple [1, 2]"""
+        with pytest.raises(SATOSAConfigurationError):
+            _load_plugin_config(data)
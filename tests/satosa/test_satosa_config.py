@@ -3,9 +3,11 @@ import os
 from unittest.mock import mock_open, patch
 
 import pytest
+import yaml
 from satosa.exception import SATOSAConfigurationError
 
 from satosa.exception import SATOSAConfigurationError
+from satosa.satosa_config import _PARSE_CACHE
 from satosa.satosa_config import SATOSAConfig
 
 TEST_RESOURCE_BASE_PATH = os.path.join(os.path.dirname(__file__), "../test_resources")
@@ -23,6 +25,21 @@ class TestSATOSAConfig:
         }
         return config
 
+    @pytest.fixture(autouse=True)
+    def clear_parse_cache(self):
+        SATOSAConfig.clear_cache()
+        yield
+        SATOSAConfig.clear_cache()
+
+    @pytest.fixture
+    def json_config_file(self, request, tmpdir, satosa_config_dict):
+        """Returns the path of satosa_config_dict written to a JSON file."""
+        encoding = getattr(request, "param", "utf-8")
+        config_file = os.path.join(str(tmpdir), "proxy_conf.json")
+        with open(config_file, "w", encoding=encoding) as f:
+            json.dump(satosa_config_dict, f)
+        return config_file
+
     def test_read_senstive_config_data_from_env_var(self, monkeypatch, non_sensitive_config_dict):
         monkeypatch.setenv("SATOSA_STATE_ENCRYPTION_KEY", "state_encryption_key")
         config = SATOSAConfig(non_sensitive_config_dict)
@@ -76,6 +93,16 @@ class TestSATOSAConfig:
         with pytest.raises(SATOSAConfigurationError):
             SATOSAConfig(satosa_config_dict)
 
+    def test_raises_exception_for_unreadable_json_plugin_config(self, tmpdir, satosa_config_dict):
+        plugin_config_file = os.path.join(str(tmpdir), "plugin.json")
+        with open(plugin_config_file, "w") as f:
+            json.dump({"foo": "bar"}, f)
+        satosa_config_dict["BACKEND_MODULES"] = [plugin_config_file]
+
+        with patch("builtins.open", side_effect=PermissionError(13, "Permission denied")):
+            with pytest.raises(SATOSAConfigurationError):
+                SATOSAConfig(satosa_config_dict)
+
     def test_can_substitute_from_environment_variable(self, monkeypatch):
         monkeypatch.setenv("SATOSA_COOKIE_STATE_NAME", "oatmeal_raisin")
         config = SATOSAConfig(
@@ -94,3 +121,89 @@ class TestSATOSAConfig:
         )
 
         assert config["COOKIE_STATE_NAME"] == 'chocolate_chip'
+
+    def test_can_read_config_from_json_file(self, json_config_file, satosa_config_dict):
+        with patch("satosa.satosa_config.load_with_environment_info") as yaml_load:
+            config = SATOSAConfig(json_config_file)
+
+        yaml_load.assert_not_called()
+        assert config["BASE"] == satosa_config_dict["BASE"]
+        assert config["COOKIE_STATE_NAME"] == satosa_config_dict["COOKIE_STATE_NAME"]
+
+    @pytest.mark.parametrize("json_config_file", ["utf-8-sig", "utf-16", "utf-32"], indirect=True)
+    def test_can_read_config_from_json_file_in_any_json_encoding(self, json_config_file, satosa_config_dict):
+        config = SATOSAConfig(json_config_file)
+
+        assert config["BASE"] == satosa_config_dict["BASE"]
+
+    def test_reads_json_config_file_with_orjson_when_installed(self, json_config_file, satosa_config_dict):
+        orjson = pytest.importorskip("orjson")
+
+        with patch.object(orjson, "loads", wraps=orjson.loads) as orjson_loads, \
+                patch("satosa.satosa_config.json.loads") as stdlib_json_loads:
+            config = SATOSAConfig(json_config_file)
+
+        orjson_loads.assert_called_once()
+        stdlib_json_loads.assert_not_called()
+        assert config["BASE"] == satosa_config_dict["BASE"]
+
+    def test_parsed_config_file_is_cached(self, json_config_file, satosa_config_dict):
+        first = SATOSAConfig(json_config_file)
+        first["BASE"] = "https://modified.example.com"
+        with patch("satosa.satosa_config.json_loads") as json_loads:
+            second = SATOSAConfig(json_config_file)
+
+        json_loads.assert_not_called()
+        assert second["BASE"] == satosa_config_dict["BASE"]
+
+    def test_modified_config_file_is_parsed_again(self, json_config_file, satosa_config_dict):
+        SATOSAConfig(json_config_file)
+
+        satosa_config_dict["BASE"] = "https://other.example.com"
+        with open(json_config_file, "w") as f:
+            json.dump(satosa_config_dict, f)
+        config = SATOSAConfig(json_config_file)
+
+        assert config["BASE"] == "https://other.example.com"
+        assert list(_PARSE_CACHE) == [os.path.abspath(json_config_file)]
+
+    def test_config_file_using_environment_is_not_cached(self, tmpdir, monkeypatch):
+        config_file = os.path.join(str(tmpdir), "proxy_conf.yaml")
+        with open(os.path.join(TEST_RESOURCE_BASE_PATH, "proxy_conf_environment_test.yaml")) as f:
+            content = f.read()
+        # UTF-16 so the tag can't be found by looking for its UTF-8 bytes
+        with open(config_file, "w", encoding="utf-16") as f:
+            f.write(content)
+
+        monkeypatch.setenv("SATOSA_COOKIE_STATE_NAME", "oatmeal_raisin")
+        SATOSAConfig(config_file)
+        monkeypatch.setenv("SATOSA_COOKIE_STATE_NAME", "chocolate_chip")
+        config = SATOSAConfig(config_file)
+
+        assert config["COOKIE_STATE_NAME"] == "chocolate_chip"
+
+    def test_constructor_should_raise_exception_for_python_object_tags(self, tmpdir, satosa_config_dict):
+        config_file = os.path.join(str(tmpdir), "proxy_conf.yaml")
+        with open(config_file, "w") as f:
+            yaml.safe_dump(satosa_config_dict, f, default_flow_style=False)
+            f.write("EXTRA: !!python/tuple [1, 2]\n")
+
+        with pytest.raises(SATOSAConfigurationError):
+            SATOSAConfig(config_file)
+
+    def test_constructor_should_raise_exception_listing_missing_mandatory_keys(self, satosa_config_dict):
+        del satosa_config_dict["BASE"]
+        del satosa_config_dict["COOKIE_STATE_NAME"]
+
+        with pytest.raises(SATOSAConfigurationError) as exc_info:
+            SATOSAConfig(satosa_config_dict)
+
+        assert str(exc_info.value) == "Missing keys in config: 'BASE', 'COOKIE_STATE_NAME'"
+
+    def test_iterates_over_config_keys(self, satosa_config_dict):
+        satosa_config_dict.pop("MICRO_SERVICES", None)
+        expected_keys = set(satosa_config_dict) | {"MICRO_SERVICES"}
+
+        config = SATOSAConfig(satosa_config_dict)
+
+        assert set(config) == expected_keys